@@ -1,21 +1,64 @@
 # app_with_models.py — ChatLaw Backend with AI Models (Stable Loading)
 import os
 import re
+import json
+import asyncio
+import atexit
+import importlib.util
+import time
 import uuid
 import logging
+import queue
 import glob
-from collections import defaultdict
+import shutil
+import tempfile
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import lru_cache
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
+from typing import AbstractSet, Dict, List, Optional, Set, Tuple
 from threading import Lock
 
+import anyio
+from cachetools import TTLCache
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 
-# Logging
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import re2
+    HAS_RE2 = True
+except ImportError:
+    HAS_RE2 = False
+
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+# Logging: request threads only enqueue records; a listener thread does the handler I/O
 logger = logging.getLogger("chatlaw")
 logging.basicConfig(level=logging.INFO)
+_root_logger = logging.getLogger()
+if _root_logger.handlers and not any(isinstance(h, QueueHandler) for h in _root_logger.handlers):
+    _log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(_log_queue, *_root_logger.handlers, respect_handler_level=True)
+    _root_logger.handlers = [QueueHandler(_log_queue)]
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
 
 # -------------------------
 # Safe Model Loading
@@ -25,24 +68,209 @@ llm_model = None
 llm_tokenizer = None
 llm_name = None
 
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+ONNX_EMBEDDER_DIR = os.path.join(MODELS_DIR, 'all-MiniLM-L6-v2-onnx-int8')
+
+def build_model_dir(model_dir: str, marker: str, build):
+    """Run build(scratch_dir) next to model_dir, then move the finished directory into place
+
+    An interrupted build never leaves a half-written model_dir behind, and concurrent workers
+    each build privately; whichever finishes second just discards its copy.
+    """
+    parent = os.path.dirname(model_dir)
+    os.makedirs(parent, exist_ok=True)
+    scratch_dir = tempfile.mkdtemp(prefix=os.path.basename(model_dir) + '.', dir=parent)
+    try:
+        build(scratch_dir)
+        if not os.path.exists(os.path.join(model_dir, marker)):
+            shutil.rmtree(model_dir, ignore_errors=True)  # leftovers of an interrupted build
+            try:
+                os.replace(scratch_dir, model_dir)
+            except OSError:
+                pass  # another worker published first
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)  # no-op once moved into place
+
+class OnnxEmbedder:
+    """INT8 ONNX Runtime encoder exposing a SentenceTransformer-style encode()"""
+    MODEL_FILE = 'model_quantized.onnx'
+    # max_seq_length from all-MiniLM-L6-v2's sentence_bert_config.json; the tokenizer alone would allow 512
+    MAX_SEQ_LENGTH = 256
+
+    def __init__(self, model_dir: str):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = os.cpu_count() or 1
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, self.MODEL_FILE),
+            sess_options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def export(model_dir: str):
+        """Export the embedding model to ONNX and dynamically quantize it to INT8 (VNNI)"""
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+
+        def build(out_dir):
+            fp32_dir = os.path.join(out_dir, 'fp32')
+            ORTModelForFeatureExtraction.from_pretrained(EMBEDDING_MODEL, export=True).save_pretrained(fp32_dir)
+            AutoTokenizer.from_pretrained(EMBEDDING_MODEL).save_pretrained(out_dir)
+            quantizer = ORTQuantizer.from_pretrained(fp32_dir)
+            quantizer.quantize(
+                save_dir=out_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            )
+            shutil.rmtree(fp32_dir)
+
+        build_model_dir(model_dir, OnnxEmbedder.MODEL_FILE, build)
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        import numpy as np
+
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            enc = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.MAX_SEQ_LENGTH,
+                return_tensors='np'
+            )
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean-pool over the attention mask, then L2-normalize (same as the ST pipeline)
+            mask = enc['attention_mask'][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled)
+
+        embeddings = np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+class EmbedderWrapper:
+    """Length-sorted batching in front of any model with a SentenceTransformer-style encode()"""
+    BATCH_SIZE = 64
+
+    def __init__(self, model):
+        self._model = model
+
+    def encode(self, texts, **kwargs):
+        import numpy as np
+
+        if isinstance(texts, str):
+            return self.encode([texts], **kwargs)[0]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Similar-length texts share a batch, so little compute goes to padding tokens
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        options = {
+            'batch_size': self.BATCH_SIZE,
+            'show_progress_bar': False,
+            'convert_to_numpy': True,
+            'normalize_embeddings': True,
+        }
+        options.update(kwargs)
+        embs = self._model.encode([texts[i] for i in order], **options)
+        out = np.empty_like(embs)
+        out[order] = embs
+        return out
+
+def load_ct2_generator(model_name: str, device: str):
+    """Load a CTranslate2 INT8 generator, converting the HF checkpoint on first use"""
+    import ctranslate2
+
+    model_dir = os.path.join(MODELS_DIR, f"{model_name}-ct2")
+    if not os.path.exists(os.path.join(model_dir, 'model.bin')):
+        from ctranslate2.converters import TransformersConverter
+        logger.info("Converting %s to CTranslate2 INT8...", model_name)
+        # force=True: the converter refuses to write into the (already created) scratch dir otherwise
+        build_model_dir(
+            model_dir, 'model.bin',
+            lambda out_dir: TransformersConverter(model_name).convert(out_dir, quantization='int8', force=True)
+        )
+
+    return ctranslate2.Generator(
+        model_dir,
+        device=device,
+        compute_type='int8_float16' if device == 'cuda' else 'int8',
+        intra_threads=os.cpu_count() or 0
+    )
+
+LLM_CUDA_QUANT = os.getenv('LLM_CUDA_QUANT', 'nf4')  # bitsandbytes weights on CUDA: 'nf4' (4-bit) or 'int8'
+
+def llm_quant_label(device: str) -> str:
+    return LLM_CUDA_QUANT if device == 'cuda' else 'int8'
+
+def load_quantized_causal_lm(model_name: str, device: str):
+    """Load an HF causal LM with quantized weights: bitsandbytes nf4/int8 on CUDA, Quanto int8 on CPU"""
+    from transformers import AutoModelForCausalLM
+
+    if device == 'cuda':
+        import torch
+        from transformers import BitsAndBytesConfig
+        if LLM_CUDA_QUANT == 'nf4':
+            config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type='nf4',
+                bnb_4bit_compute_dtype=torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            )
+        else:
+            config = BitsAndBytesConfig(load_in_8bit=True)
+        return AutoModelForCausalLM.from_pretrained(model_name, quantization_config=config, device_map='auto')
+
+    from optimum.quanto import quantize, freeze, qint8
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    quantize(model, weights=qint8)
+    freeze(model)
+    return model
+
 def safe_import():
     """Import ML libraries safely"""
     global embedder, llm_model, llm_tokenizer, llm_name
-    
+
     try:
         import torch
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        logger.info(f"Using device: {device}")
-        
-        # Load embeddings model
-        try:
-            from sentence_transformers import SentenceTransformer
-            logger.info("Loading embedding model...")
-            embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2', device=device)
-            logger.info("✓ Embedding model loaded")
-        except Exception as e:
-            logger.warning(f"Embedding model failed: {e}")
-            embedder = None
+        logger.info("Using device: %s", device)
+
+        # Load embeddings model (INT8 ONNX Runtime on CPU, PyTorch otherwise)
+        if device == 'cpu':
+            try:
+                if not os.path.exists(os.path.join(ONNX_EMBEDDER_DIR, OnnxEmbedder.MODEL_FILE)):
+                    logger.info("Exporting embedding model to ONNX INT8...")
+                    OnnxEmbedder.export(ONNX_EMBEDDER_DIR)
+                embedder = OnnxEmbedder(ONNX_EMBEDDER_DIR)
+                logger.info("✓ Embedding model loaded (ONNX Runtime INT8)")
+            except Exception as e:
+                logger.warning("ONNX embedder unavailable, falling back to PyTorch: %s", e)
+                embedder = None
+
+        if embedder is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+                logger.info("Loading embedding model...")
+                embedder = SentenceTransformer(EMBEDDING_MODEL, device=device)
+                logger.info("✓ Embedding model loaded")
+            except Exception as e:
+                logger.warning("Embedding model failed: %s", e)
+                embedder = None
+
+        if embedder is not None:
+            embedder = EmbedderWrapper(embedder)
         
         # Load LLM (small, stable model)
         try:
@@ -56,37 +284,55 @@ def safe_import():
             
             for model_name in models_to_try:
                 try:
-                    logger.info(f"Attempting to load LLM: {model_name}")
+                    logger.info("Attempting to load LLM: %s", model_name)
                     llm_tokenizer = AutoTokenizer.from_pretrained(model_name)
-                    llm_model = AutoModelForCausalLM.from_pretrained(
-                        model_name,
-                        torch_dtype=torch.float32
-                    ).to(device)
+                    try:
+                        llm_model = load_ct2_generator(model_name, device)
+                        logger.info("✓ LLM loaded: %s (CTranslate2 INT8)", model_name)
+                    except Exception as e:
+                        logger.warning("CTranslate2 unavailable for %s: %s", model_name, e)
+                        try:
+                            llm_model = load_quantized_causal_lm(model_name, device)
+                            logger.info("✓ LLM loaded: %s (%s)", model_name, llm_quant_label(device))
+                        except Exception as e:
+                            logger.warning("%s load failed for %s, loading FP32: %s", llm_quant_label(device), model_name, e)
+                            llm_model = AutoModelForCausalLM.from_pretrained(
+                                model_name,
+                                torch_dtype=torch.float32
+                            ).to(device)
+                            logger.info("✓ LLM loaded: %s", model_name)
                     llm_name = model_name
-                    logger.info(f"✓ LLM loaded: {model_name}")
                     break
                 except Exception as e:
-                    logger.warning(f"Failed to load {model_name}: {e}")
+                    logger.warning("Failed to load %s: %s", model_name, e)
                     continue
                     
         except Exception as e:
-            logger.warning(f"LLM loading failed: {e}")
+            logger.warning("LLM loading failed: %s", e)
             llm_model = None
             
     except Exception as e:
-        logger.error(f"Failed to import ML libraries: {e}")
-
-# Try to load models
-safe_import()
+        logger.error("Failed to import ML libraries: %s", e)
 
-# Import other dependencies
-try:
-    import pandas as pd
-    import numpy as np
-    import faiss
-    HAS_FAISS = True
-except:
-    HAS_FAISS = False
+def load_models(loop: asyncio.AbstractEventLoop, ready: asyncio.Event):
+    """Load models off the event loop, then signal readiness back on it"""
+    try:
+        safe_import()
+        if embedder is not None:
+            # First encode pays session/graph initialisation; do it before reporting ready
+            try:
+                embedder.encode(["warm up"])
+            except Exception as e:
+                logger.warning("Embedder warm-up failed: %s", e)
+        logger.info("Models ready | LLM: %s | Embeddings: %s",
+                    llm_name or 'Not loaded', 'Loaded' if embedder else 'Not loaded')
+    finally:
+        loop.call_soon_threadsafe(ready.set)
+
+# Optional search dependencies: only probe for them here; numpy/pandas/faiss
+# are imported by the code paths that use them, keeping cold start fast
+HAS_FAISS = importlib.util.find_spec('faiss') is not None
+if not HAS_FAISS:
     logger.warning("FAISS not available, search disabled")
 
 # -------------------------
@@ -117,30 +363,99 @@ class ConsultationFinalResponse(BaseModel):
 # -------------------------
 class KnowledgeGraph:
     def __init__(self):
-        self.entities = defaultdict(list)
+        # entity_type -> {value: None}: insertion-ordered like a list, O(1) membership like a set
+        self.entities = defaultdict(dict)
         self.relations = []
         self.context = {}
+        self._subtype_text = None  # memoized situation_plus_entities()
 
     def add_entity(self, entity_type: str, value: str):
-        if value and value.strip() and value not in self.entities[entity_type]:
-            self.entities[entity_type].append(value.strip())
+        v = value.strip() if value else ''
+        if v and v not in self.entities[entity_type]:
+            self.entities[entity_type][v] = None
+            self._subtype_text = None
+
+    def add_entities_bulk(self, mapping: Dict[str, List[str]]):
+        """add_entity for every value in {entity_type: [values]}, one dict.update per type"""
+        for entity_type, values in mapping.items():
+            if not values:
+                continue
+            bucket = self.entities[entity_type]
+            size = len(bucket)
+            bucket.update(dict.fromkeys(filter(None, map(str.strip, values))))
+            if len(bucket) != size:
+                self._subtype_text = None
+
+    def snapshot(self) -> 'KnowledgeGraph':
+        """Copy safe to read on a worker thread while this graph keeps taking entities"""
+        kg = KnowledgeGraph()
+        kg.entities.update((entity_type, dict(values)) for entity_type, values in self.entities.items())
+        kg.relations = list(self.relations)
+        kg.context = dict(self.context)
+        return kg
 
     def set_context(self, key: str, value: str):
         self.context[key] = value
+        if key == 'situation':
+            self._subtype_text = None
+
+    def situation_plus_entities(self) -> str:
+        """Situation followed by every entity value; the text subtype detection scores"""
+        if self._subtype_text is None:
+            self._subtype_text = self.context.get('situation', '') + " " + " ".join(
+                [x for vals in self.entities.values() for x in vals])
+        return self._subtype_text
 
     def get_summary(self) -> str:
         parts = []
         for entity_type, values in self.entities.items():
             if values:
-                parts.append(f"{entity_type.upper()}: {', '.join(values[:3])}")
+                parts.append(f"{entity_type.upper()}: {', '.join(islice(values, 3))}")
         if self.context.get('situation'):
             parts.append(f"SITUATION: {self.context['situation'][:200]}")
         return " | ".join(parts) if parts else "Knowledge graph empty"
 
+# -------------------------
+# Keyword Matching (Aho-Corasick)
+# -------------------------
+KeywordItems = Tuple[Tuple[str, Tuple[str, ...]], ...]
+
+def pack_keywords(keyword_table: Dict[str, List[str]]) -> KeywordItems:
+    """Freeze a {label: [keywords]} table into tuples for the per-request scans"""
+    return tuple((label, tuple(keywords)) for label, keywords in keyword_table.items())
+
+def build_keyword_automaton(keyword_items: KeywordItems):
+    """Build one automaton over every keyword, tagged with the labels that list it"""
+    if not HAS_AHOCORASICK:
+        return None
+    automaton = ahocorasick.Automaton()
+    for label, keywords in keyword_items:
+        for kw in keywords:
+            _, labels = automaton.get(kw, (kw, ()))
+            automaton.add_word(kw, (kw, labels + (label,)))
+    automaton.make_automaton()
+    return automaton
+
+def count_keyword_hits(automaton, keyword_items: KeywordItems, text: str) -> Dict[str, int]:
+    """Count distinct keywords present in text per label, in a single pass when possible"""
+    if automaton is None:
+        return {label: sum(kw in text for kw in keywords) for label, keywords in keyword_items}
+
+    scores = {label: 0 for label, _ in keyword_items}
+    seen = set()
+    for _, (kw, labels) in automaton.iter(text):
+        if kw not in seen:
+            seen.add(kw)
+            for label in labels:
+                scores[label] += 1
+    return scores
+
 # -------------------------
 # Smart Classifier Agent
 # -------------------------
 class SmartClassifierAgent:
+    CACHE_MAX_QUERY_LEN = 2048  # longer queries skip the memo to keep cache keys small
+
     def __init__(self):
         self.case_keywords = {
             'criminal': ['theft','stolen','robbery','assault','murder','rape','dacoity','fir','police','crime','burglar','pickpocket','extortion','blackmail'],
@@ -148,50 +463,110 @@ class SmartClassifierAgent:
             'property': ['land','boundary','inheritance','encroachment','tenant','landlord','eviction','deed','title','plot','mutation'],
             'contract': ['agreement','breach','contract','payment','outstanding','invoice','debt','loan','delivery','default']
         }
+        self._case_items = pack_keywords(self.case_keywords)
+        self._automaton = build_keyword_automaton(self._case_items)
+        # Identical queries (retries, demos, health checks) skip the keyword scan
+        self._classify_cached = lru_cache(maxsize=512)(self._classify)
 
     def initial_classify(self, query: str) -> tuple:
+        if len(query) > self.CACHE_MAX_QUERY_LEN:
+            return self._classify(query)
+        return self._classify_cached(query)
+
+    def _classify(self, query: str) -> tuple:
         q = query.lower()
-        scores = {}
-        for case_type, keywords in self.case_keywords.items():
-            match_count = sum(1 for kw in keywords if kw in q)
-            scores[case_type] = match_count
+        best_type, best_score = 'general', 0
+        for case_type, score in count_keyword_hits(self._automaton, self._case_items, q).items():
+            if score > best_score:
+                best_type, best_score = case_type, score
 
-        if max(scores.values()) == 0:
+        if best_score == 0:
             return 'general', 0.5
 
-        best_type = max(scores, key=scores.get)
-        confidence = min(scores[best_type] / 5.0, 1.0)
+        confidence = min(best_score / 5.0, 1.0)
         return best_type, confidence
 
 # -------------------------
 # Entity Extraction Agent (Regex-based)
 # -------------------------
+# Stdlib patterns are Unicode-aware (\d matches Devanagari digits, \b respects é/ß); RE2's
+# \d and \b are ASCII-only, so the RE2 twins below are used only for pure-ASCII text.
+# _CAPS_RE fires on nearly every sentence, so the RE2 gate rarely skips a pattern and its
+# per-call overhead only pays off on long narratives
+_RE2_MIN_TEXT_LEN = 512
+_DATE_RE = re.compile(r'\b\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4}\b')
+_MONTH_RE = re.compile(r'(?i)\b(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2}(?:,\s*\d{4})?')
+_VALUE_RE = re.compile(r'\b(?:Rs\.?|₹)\s*[\d,]+\b')
+_CAPS_RE = re.compile(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,2}\b')
+_ENTITY_RES = (_DATE_RE, _MONTH_RE, _VALUE_RE, _CAPS_RE)
+_DATE_ID, _MONTH_ID, _VALUE_ID, _CAPS_ID = range(len(_ENTITY_RES))
+
+def _first_matches(pattern, text: str, limit: int) -> List[str]:
+    """Like findall(text)[:limit], but stops scanning once limit matches are found"""
+    return [m.group() for m in islice(pattern.finditer(text), limit)]
+
+_ITEM_KEYWORDS = tuple((kw, kw.lower()) for kw in
+                       ['phone','laptop','car','house','land','jewelry','money','document','agreement','FIR','complaint'])
+
+def _build_re2_set(patterns):
+    pattern_set = re2.Set.SearchSet(re2.Options())
+    for pattern in patterns:
+        pattern_set.Add(pattern)
+    pattern_set.Compile()
+    return pattern_set
+
+if HAS_RE2:
+    # One DFA pass tells us which entity patterns fire; only those get a findall
+    _RE2_ENTITY_RES = tuple(re2.compile(r.pattern) for r in _ENTITY_RES)
+    _ENTITY_SET = _build_re2_set(r.pattern for r in _ENTITY_RES)
+    _ITEM_SET = _build_re2_set(re2.escape(kw_lower) for _, kw_lower in _ITEM_KEYWORDS)
+
 class EntityExtractionAgent:
+    def _scan(self, text: str, text_lower: str, use_re2: bool):
+        """Return (ids of entity patterns that match, ids of item keywords present)"""
+        if HAS_RE2:
+            # Keywords are plain literals, so the item set is safe on any text.
+            # Set.Match returns None rather than an empty list when nothing fires
+            item_ids = sorted(_ITEM_SET.Match(text_lower) or ())
+        else:
+            item_ids = [i for i, (_, kw_lower) in enumerate(_ITEM_KEYWORDS) if kw_lower in text_lower]
+        if use_re2:
+            return frozenset(_ENTITY_SET.Match(text) or ()), item_ids
+        return frozenset(range(len(_ENTITY_RES))), item_ids
+
     def extract(self, text: str):
         out = {'dates': [], 'locations': [], 'values': [], 'items': [], 'parties': []}
+        text_lower = text.lower()
+        use_re2 = HAS_RE2 and len(text) >= _RE2_MIN_TEXT_LEN and text.isascii()
+        date_re, month_re, value_re, caps_re = _RE2_ENTITY_RES if use_re2 else _ENTITY_RES
+        fired, item_ids = self._scan(text, text_lower, use_re2)
+        # Repeated matches are left in; KnowledgeGraph.add_entities_bulk collapses them
 
         # Extract dates
-        out['dates'] = re.findall(r'\b\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4}\b', text)[:3]
-        months = re.findall(r'\b(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2}(?:,\s*\d{4})?', text, flags=re.I)
-        out['dates'] += months
+        if _DATE_ID in fired:
+            out['dates'] = _first_matches(date_re, text, 3)
+        if _MONTH_ID in fired:
+            out['dates'] += month_re.findall(text)
         
         # Extract values
-        out['values'] = re.findall(r'\b(?:Rs\.?|₹)\s*[\d,]+\b', text)[:3]
+        if _VALUE_ID in fired:
+            out['values'] = _first_matches(value_re, text, 3)
         
         # Extract locations (capitalized words)
-        caps = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,2}\b', text)
-        out['locations'] = caps[:4]
+        if _CAPS_ID in fired:
+            out['locations'] = _first_matches(caps_re, text, 4)
         
-        # Extract items
-        keywords = ['phone','laptop','car','house','land','jewelry','money','document','agreement','FIR','complaint']
-        out['items'] = [kw for kw in keywords if kw.lower() in text.lower()][:4]
+        # Extract items (already unique: one entry per keyword)
+        out['items'] = [_ITEM_KEYWORDS[i][0] for i in item_ids[:4]]
         
-        return {k:list(dict.fromkeys(v)) for k,v in out.items()}
+        return out
 
 # -------------------------
 # Adaptive Question Generator (FIXED)
 # -------------------------
 class AdaptiveQuestionGenerator:
+    CACHE_MAX_TEXT_LEN = 2048  # longer texts skip the memo to keep cache keys small
+
     OFFENSE_KEYWORDS = {
         'murder':  ['murder','killed','homicide','stabbed','shot','strangled','burned','ipc 302','302'],
         'theft':   ['theft','stolen','pickpocket','burglary','phone was stolen','ipc 379','379'],
@@ -274,48 +649,310 @@ class AdaptiveQuestionGenerator:
         }
     }
 
+    def __init__(self):
+        self._offense_items = pack_keywords(self.OFFENSE_KEYWORDS)
+        self._offense_automaton = build_keyword_automaton(self._offense_items)
+        # Turns that add no new entities rescore the same text, so most calls are hits
+        self._detect_cached = lru_cache(maxsize=4096)(self._detect_crime_subtype)
+        # template key -> ((category, question), ...) in asking order
+        self._flat_templates = {
+            key: tuple((category, q) for category, questions in templates.items() for q in questions)
+            for key, templates in self.QUESTION_TEMPLATES.items()
+        }
+
     def detect_crime_subtype(self, text: str) -> str:
+        if len(text) > self.CACHE_MAX_TEXT_LEN:
+            return self._detect_crime_subtype(text)
+        return self._detect_cached(text)
+
+    def _detect_crime_subtype(self, text: str) -> str:
         t = text.lower()
-        best = 'theft'
-        best_score = 0
-        for subtype, keywords in self.OFFENSE_KEYWORDS.items():
-            score = sum(1 for kw in keywords if kw in t)
-            if score > best_score:
-                best = subtype
-                best_score = score
-        return best
+        scores = count_keyword_hits(self._offense_automaton, self._offense_items, t)
+        # max() keeps the first subtype on ties (dict order); no hits at all means theft
+        best = max(scores, key=scores.get)
+        return best if scores[best] else 'theft'
 
-    def generate_next(self, case_type: str, kg: KnowledgeGraph, asked: List[str]) -> Optional[str]:
-        """Generate next question based on case type, ensuring no repeats"""
-        situation = kg.context.get('situation', '')
-        
-        # Determine which template to use
+    def _template_key(self, case_type: str, kg: KnowledgeGraph) -> str:
         if case_type == 'criminal':
-            subtype = kg.context.get('criminal_subtype') or self.detect_crime_subtype(situation)
-            templates = self.QUESTION_TEMPLATES.get(subtype, self.QUESTION_TEMPLATES['theft'])
+            subtype = kg.context.get('criminal_subtype') or self.detect_crime_subtype(kg.context.get('situation', ''))
+            return subtype if subtype in self._flat_templates else 'theft'
+        # For non-criminal cases, use case_type directly
+        return case_type if case_type in self._flat_templates else 'general'
+
+    def generate_next(self, case_type: str, kg: KnowledgeGraph, asked: AbstractSet[str],
+                      queues: Optional[Dict[str, deque]] = None) -> Optional[str]:
+        """Generate next question based on case type, ensuring no repeats
+
+        queues holds the session's pending questions per template; asked questions are popped
+        off the front once, so later turns don't rescan them. The subtype can change between
+        turns, hence one queue per template rather than a single ranked list.
+        """
+        key = self._template_key(case_type, kg)
+        if queues is None:
+            pending = deque(self._flat_templates[key])
         else:
-            # For non-criminal cases, use case_type directly
-            templates = self.QUESTION_TEMPLATES.get(case_type, self.QUESTION_TEMPLATES['general'])
-
-        # Iterate through all question categories
-        for category, questions in templates.items():
-            # Find questions that haven't been asked yet
-            missing_questions = [q for q in questions if q not in asked]
-            if missing_questions:
-                logger.info(f"Next question from category '{category}': {missing_questions[0]}")
-                return missing_questions[0]
+            pending = queues.get(key)
+            if pending is None:
+                pending = queues[key] = deque(self._flat_templates[key])
+
+        # First question (in category order) that hasn't been asked yet
+        while pending and pending[0][1] in asked:
+            pending.popleft()
+        if pending:
+            category, q = pending[0]
+            logger.info("Next question from category '%s': %s", category, q)
+            return q
 
         logger.info("All questions exhausted")
         return None
 
+# -------------------------
+# Report Templates
+# -------------------------
+@lru_cache(maxsize=4)
+def _format_timestamp(epoch_sec: int) -> str:
+    return datetime.fromtimestamp(epoch_sec).strftime('%Y-%m-%d %H:%M:%S')
+
+def report_timestamp() -> str:
+    """Current local time for report headers, formatted at most once per second"""
+    return _format_timestamp(int(time.time()))
+
+# Reports are assembled from sections so they can be streamed or joined
+_CASE_REPORT_HEADER = """═══════════════════════════════════════════════════
+LEGAL CONSULTATION REPORT - {title}
+═══════════════════════════════════════════════════
+
+Case Type: {case_label}
+"""
+
+_CLIENT_STATEMENT_SECTION = """─────────────────────────────────────────────────
+CLIENT STATEMENT:
+{situation}
+
+"""
+
+_FACTS_COLLECTED_SECTION = """─────────────────────────────────────────────────
+FACTS COLLECTED:
+{facts}
+
+"""
+
+_LEGAL_ANALYSIS_HEADING = """─────────────────────────────────────────────────
+LEGAL ANALYSIS:
+
+"""
+
+_NO_FACTS_COLLECTED = 'Limited information - answer all questions for detailed analysis'
+
+_ROBBERY_STATIC = """
+APPLICABLE LAWS:
+• IPC Section 390: Definition of Robbery (theft with force/threat)
+• IPC Section 392: Punishment for robbery (up to 10 years + fine)
+• If weapon used: IPC Section 397 (robbery with deadly weapon) - up to 14 years
+• If injury caused: Enhanced punishment under relevant sections
+
+IMMEDIATE ACTIONS REQUIRED:
+1. File FIR immediately at the nearest police station (jurisdiction based on crime location)
+2. Provide detailed description of perpetrators if seen
+3. Request police to preserve CCTV footage from the area
+4. Get medical examination done if any injuries sustained
+5. Prepare list of stolen items with proof of ownership
+6. Identify and contact witnesses immediately
+
+EVIDENCE TO COLLECT:
+• CCTV footage from crime scene and surrounding areas
+• Witness statements (get written statements if possible)
+• Photos of crime scene and any damage
+• Medical reports if injuries present
+• Purchase receipts/serial numbers of stolen items
+• Bank statements showing cash withdrawal (if cash stolen)
+
+LEGAL TIMELINE:
+• FIR should be filed within 24 hours for best results
+• CCTV footage may be overwritten after 7-30 days
+• Witness memory fades - record statements quickly
+
+NEXT STEPS:
+1. File FIR today if not already done
+2. Engage a criminal lawyer to follow up on investigation
+3. Monitor police investigation progress
+4. Be prepared to identify accused if caught
+5. Keep all evidence organized for trial
+
+"""
+
+_ROBBERY_REMINDERS = """─────────────────────────────────────────────────
+CRITICAL REMINDERS:
+⚠ Time is of the essence - evidence deteriorates quickly
+⚠ FIR must be filed immediately
+⚠ This is a serious offense - professional legal representation recommended
+⚠ Cooperate fully with police investigation
+
+"""
+
+_ROBBERY_DISCLAIMER = """─────────────────────────────────────────────────
+DISCLAIMER:
+This is a preliminary legal analysis based on the information provided.
+For case-specific advice and representation, please consult a qualified
+criminal lawyer immediately. Laws and procedures may vary by state.
+═══════════════════════════════════════════════════"""
+
+_PROPERTY_STATIC = """
+APPLICABLE LAWS:
+• Transfer of Property Act, 1882
+• Indian Succession Act, 1925 (if inheritance dispute)
+• Specific Relief Act, 1963 (for specific performance)
+• Registration Act, 1908 (for property registration)
+• State-specific Land Revenue Acts
+
+IMMEDIATE ACTIONS REQUIRED:
+1. Collect all property documents (sale deed, title deed, mutation records)
+2. Get property survey done to verify boundaries
+3. Check encumbrance certificate from sub-registrar office
+4. Verify ownership chain - trace back 30 years minimum
+5. Check for any pending litigation on the property
+6. Document any illegal occupation or encroachment with photos/videos
+
+DOCUMENTS TO COLLECT:
+• Sale/Purchase deed
+• Title deed and ownership chain
+• Mutation records (7/12 extract, khasra, etc.)
+• Property tax receipts
+• Encumbrance certificate
+• Survey/plot plan
+• Building plan approval (if applicable)
+• Will/succession certificate (if inheritance case)
+
+RESOLUTION OPTIONS:
+1. Negotiation and settlement (fastest and cheapest)
+2. Mediation through court or private mediator
+3. Civil suit in appropriate court
+4. Partition suit (if co-owned property)
+5. Injunction to prevent alienation/damage
+
+NEXT STEPS:
+1. Consult a property lawyer with all documents
+2. Get legal opinion on ownership status
+3. Attempt amicable settlement first
+4. If settlement fails, file appropriate civil suit
+5. Apply for interim injunction if urgent
+
+"""
+
+_PROPERTY_REMINDERS = """─────────────────────────────────────────────────
+CRITICAL REMINDERS:
+⚠ Property disputes can take years - document everything
+⚠ Verify all documents before making any payment
+⚠ Get title search done by professional lawyer
+⚠ Do not make any physical changes to disputed property
+
+"""
+
+_PROPERTY_DISCLAIMER = """─────────────────────────────────────────────────
+DISCLAIMER:
+This is a preliminary legal analysis based on the information provided.
+Property laws vary by state. Please consult a qualified property lawyer
+for case-specific advice and representation.
+═══════════════════════════════════════════════════"""
+
+_TEMPLATE_REPORT_HEADER = """═══════════════════════════════════════════════════
+LEGAL CONSULTATION REPORT
+═══════════════════════════════════════════════════
+
+Case Type: {case_type_upper}
+Subtype: {subtype}
+"""
+
+# Kept out of the header templates: the report sections are built first and stamped last
+_GENERATED_SECTION = """Generated: {ts}
+
+"""
+
+_FACTS_EXTRACTED_SECTION = """─────────────────────────────────────────────────
+FACTS EXTRACTED:
+{facts}
+
+"""
+
+_TEMPLATE_ANALYSIS_SECTION = """─────────────────────────────────────────────────
+LEGAL ANALYSIS:
+
+Based on the information provided, this appears to be a {case_type} 
+matter requiring immediate attention.
+
+RECOMMENDED LEGAL STEPS:
+{steps}
+
+IMPORTANT NOTES:
+• Act promptly - legal timelines are strict
+• Document everything thoroughly
+• Preserve all evidence
+• Consult a qualified lawyer immediately for case-specific advice
+
+"""
+
+_TEMPLATE_DISCLAIMER = """─────────────────────────────────────────────────
+DISCLAIMER:
+This is a preliminary analysis based on limited information.
+Please consult a qualified legal professional for authoritative advice.
+═══════════════════════════════════════════════════"""
+
+_CRIMINAL_STEPS = """1. File FIR immediately at the nearest police station
+2. Collect and preserve all evidence (photos, documents, CCTV)
+3. Get witness statements recorded
+4. Obtain medical examination report if injuries present
+5. Consult a criminal lawyer for detailed legal strategy"""
+
+_FAMILY_STEPS = """1. Attempt mediation/counseling first if applicable
+2. Gather all relevant documents (marriage certificate, financial records)
+3. Document any incidents with dates and evidence
+4. Consult a family law specialist
+5. Consider filing petition in family court if mediation fails"""
+
+_GENERAL_STEPS = """1. Gather all relevant documents and evidence
+2. Document timeline of events
+3. Identify witnesses if any
+4. Consult appropriate legal specialist
+5. File case in appropriate court if required"""
+
 # -------------------------
 # AI-Powered Analyzer with LLM
 # -------------------------
 class AIAnalyzer:
     def __init__(self):
-        self.has_llm = llm_model is not None
+        # (case_type, subtype) -> handler; subtype None matches any subtype of that case type
+        self._handlers = {
+            ('criminal', 'robbery'): self._analyze_robbery_case,
+            ('criminal', 'theft'): self._analyze_theft_case,
+            ('criminal', 'murder'): self._analyze_murder_case,
+            ('criminal', 'assault'): self._analyze_assault_case,
+            ('property', None): self._analyze_property_case,
+            ('family', None): self._analyze_family_case,
+            ('contract', None): self._analyze_contract_case,
+        }
         
+    @property
+    def has_llm(self) -> bool:
+        # Models load in the background, so check the module global on each access
+        return llm_model is not None
+
     def analyze(self, case_type: str, kg: KnowledgeGraph) -> str:
+        return self.render(self.analyze_body(case_type, kg))
+
+    def analyze_sections(self, case_type: str, kg: KnowledgeGraph) -> List[str]:
+        """Report as an ordered list of sections (joined by analyze, streamed by the API)"""
+        return self._with_timestamp(self.analyze_body(case_type, kg))
+
+    def render(self, body: List[str]) -> str:
+        """Full report from analyze_body() output, stamped with the current time"""
+        return ''.join(self._with_timestamp(body))
+
+    def _with_timestamp(self, sections) -> List[str]:
+        # Header first, then the timestamp line, then the body
+        return [sections[0], _GENERATED_SECTION.format(ts=report_timestamp()), *sections[1:]]
+
+    def analyze_body(self, case_type: str, kg: KnowledgeGraph) -> List[str]:
+        """Timestamp-free report sections; the first is the report header"""
         situation = kg.context.get('situation', '')
         
         # Get appropriate subtype based on case_type
@@ -332,7 +969,7 @@ class AIAnalyzer:
         
         # For now, use enhanced template-based analysis
         # (distilgpt2 is too small for quality legal analysis)
-        logger.info(f"🤖 Generating enhanced legal analysis for {case_type}/{subtype}...")
+        logger.info("🤖 Generating enhanced legal analysis for %s/%s...", case_type, subtype)
         return self._generate_enhanced_report(case_type, subtype, situation, fact_text, kg)
     
     def _format_report(self, case_type, subtype, situation, facts, analysis):
@@ -342,7 +979,7 @@ LEGAL CONSULTATION REPORT
 
 Case Type: {case_type.upper()}
 Subtype: {subtype}
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+Generated: {report_timestamp()}
 
 ─────────────────────────────────────────────────
 CLIENT STATEMENT:
@@ -362,41 +999,29 @@ This is an AI-generated preliminary analysis. Please consult
 a qualified legal professional for authoritative advice.
 ═══════════════════════════════════════════════════"""
     
-    def _generate_enhanced_report(self, case_type, subtype, situation, facts, kg: KnowledgeGraph):
+    def _generate_enhanced_report(self, case_type, subtype, situation, facts, kg: KnowledgeGraph) -> List[str]:
         """Generate intelligent analysis based on case facts"""
         
         # Get collected information
-        dates = kg.entities.get('dates', [])
-        locations = kg.entities.get('locations', [])
-        values = kg.entities.get('values', [])
-        items = kg.entities.get('items', [])
+        dates = list(kg.entities.get('dates', ()))
+        locations = list(kg.entities.get('locations', ()))
+        values = list(kg.entities.get('values', ()))
+        items = list(kg.entities.get('items', ()))
         
         # Analyze based on case type and facts
-        if case_type == 'criminal' and subtype == 'robbery':
-            return self._analyze_robbery_case(situation, dates, locations, values, items, facts)
-        elif case_type == 'criminal' and subtype == 'theft':
-            return self._analyze_theft_case(situation, dates, locations, values, items, facts)
-        elif case_type == 'criminal' and subtype == 'murder':
-            return self._analyze_murder_case(situation, dates, locations, facts)
-        elif case_type == 'criminal' and subtype == 'assault':
-            return self._analyze_assault_case(situation, dates, locations, facts)
-        elif case_type == 'property':
-            return self._analyze_property_case(situation, dates, locations, values, facts)
-        elif case_type == 'family':
-            return self._analyze_family_case(situation, dates, facts)
-        elif case_type == 'contract':
-            return self._analyze_contract_case(situation, dates, values, facts)
-        else:
+        handler = self._handlers.get((case_type, subtype)) or self._handlers.get((case_type, None))
+        if handler is None:
             return self._generate_template_report(case_type, subtype, situation, facts)
+        return handler(situation, dates, locations, values, items, facts)
     
     def _analyze_robbery_case(self, situation, dates, locations, values, items, facts):
         """Detailed robbery case analysis"""
         
-        # Build context-aware analysis
-        analysis = []
-        
-        analysis.append("CASE OVERVIEW:")
-        analysis.append(f"This is a robbery case under IPC Section 390-392 (Robbery and Dacoity).")
+        # Only the fact-dependent lines are built per call
+        analysis = [
+            "CASE OVERVIEW:",
+            "This is a robbery case under IPC Section 390-392 (Robbery and Dacoity).",
+        ]
         
         if dates:
             analysis.append(f"The incident occurred on {dates[0]}. Time is crucial - report immediately.")
@@ -410,93 +1035,35 @@ a qualified legal professional for authoritative advice.
         if items:
             analysis.append(f"Items taken: {', '.join(items)}. Document with purchase receipts/serial numbers.")
         
-        analysis.append("\nAPPLICABLE LAWS:")
-        analysis.append("• IPC Section 390: Definition of Robbery (theft with force/threat)")
-        analysis.append("• IPC Section 392: Punishment for robbery (up to 10 years + fine)")
-        analysis.append("• If weapon used: IPC Section 397 (robbery with deadly weapon) - up to 14 years")
-        analysis.append("• If injury caused: Enhanced punishment under relevant sections")
-        
-        analysis.append("\nIMMEDIATE ACTIONS REQUIRED:")
-        analysis.append("1. File FIR immediately at the nearest police station (jurisdiction based on crime location)")
-        analysis.append("2. Provide detailed description of perpetrators if seen")
-        analysis.append("3. Request police to preserve CCTV footage from the area")
-        analysis.append("4. Get medical examination done if any injuries sustained")
-        analysis.append("5. Prepare list of stolen items with proof of ownership")
-        analysis.append("6. Identify and contact witnesses immediately")
-        
-        analysis.append("\nEVIDENCE TO COLLECT:")
-        analysis.append("• CCTV footage from crime scene and surrounding areas")
-        analysis.append("• Witness statements (get written statements if possible)")
-        analysis.append("• Photos of crime scene and any damage")
-        analysis.append("• Medical reports if injuries present")
-        analysis.append("• Purchase receipts/serial numbers of stolen items")
-        analysis.append("• Bank statements showing cash withdrawal (if cash stolen)")
-        
-        analysis.append("\nLEGAL TIMELINE:")
-        analysis.append("• FIR should be filed within 24 hours for best results")
-        analysis.append("• CCTV footage may be overwritten after 7-30 days")
-        analysis.append("• Witness memory fades - record statements quickly")
-        
-        analysis.append("\nNEXT STEPS:")
-        analysis.append("1. File FIR today if not already done")
-        analysis.append("2. Engage a criminal lawyer to follow up on investigation")
-        analysis.append("3. Monitor police investigation progress")
-        analysis.append("4. Be prepared to identify accused if caught")
-        analysis.append("5. Keep all evidence organized for trial")
-        
-        return f"""═══════════════════════════════════════════════════
-LEGAL CONSULTATION REPORT - ROBBERY CASE
-═══════════════════════════════════════════════════
-
-Case Type: CRIMINAL - ROBBERY
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-─────────────────────────────────────────────────
-CLIENT STATEMENT:
-{situation}
-
-─────────────────────────────────────────────────
-FACTS COLLECTED:
-{facts if facts else 'Limited information - answer all questions for detailed analysis'}
-
-─────────────────────────────────────────────────
-LEGAL ANALYSIS:
-
-{chr(10).join(analysis)}
-
-─────────────────────────────────────────────────
-CRITICAL REMINDERS:
-⚠ Time is of the essence - evidence deteriorates quickly
-⚠ FIR must be filed immediately
-⚠ This is a serious offense - professional legal representation recommended
-⚠ Cooperate fully with police investigation
-
-─────────────────────────────────────────────────
-DISCLAIMER:
-This is a preliminary legal analysis based on the information provided.
-For case-specific advice and representation, please consult a qualified
-criminal lawyer immediately. Laws and procedures may vary by state.
-═══════════════════════════════════════════════════"""
+        return [
+            _CASE_REPORT_HEADER.format(title='ROBBERY CASE', case_label='CRIMINAL - ROBBERY'),
+            _CLIENT_STATEMENT_SECTION.format(situation=situation),
+            _FACTS_COLLECTED_SECTION.format(facts=facts if facts else _NO_FACTS_COLLECTED),
+            _LEGAL_ANALYSIS_HEADING + '\n'.join(analysis) + '\n',
+            _ROBBERY_STATIC,
+            _ROBBERY_REMINDERS,
+            _ROBBERY_DISCLAIMER,
+        ]
     
     def _analyze_theft_case(self, situation, dates, locations, values, items, facts):
         """Similar detailed analysis for theft"""
         return self._generate_template_report('criminal', 'theft', situation, facts)
     
-    def _analyze_murder_case(self, situation, dates, locations, facts):
+    def _analyze_murder_case(self, situation, dates, locations, values, items, facts):
         """Similar detailed analysis for murder"""
         return self._generate_template_report('criminal', 'murder', situation, facts)
     
-    def _analyze_assault_case(self, situation, dates, locations, facts):
+    def _analyze_assault_case(self, situation, dates, locations, values, items, facts):
         """Similar detailed analysis for assault"""
         return self._generate_template_report('criminal', 'assault', situation, facts)
     
-    def _analyze_property_case(self, situation, dates, locations, values, facts):
+    def _analyze_property_case(self, situation, dates, locations, values, items, facts):
         """Detailed property dispute analysis"""
         
-        analysis = []
-        
-        analysis.append("CASE OVERVIEW:")
-        analysis.append("This is a property dispute case under relevant civil/property laws.")
+        analysis = [
+            "CASE OVERVIEW:",
+            "This is a property dispute case under relevant civil/property laws.",
+        ]
         
         if locations:
             analysis.append(f"Property location: {locations[0]}. Survey records and mutation documents are crucial.")
@@ -504,162 +1071,106 @@ criminal lawyer immediately. Laws and procedures may vary by state.
         if values:
             analysis.append(f"Estimated value: {values[0]}. Property valuation report recommended.")
         
-        analysis.append("\nAPPLICABLE LAWS:")
-        analysis.append("• Transfer of Property Act, 1882")
-        analysis.append("• Indian Succession Act, 1925 (if inheritance dispute)")
-        analysis.append("• Specific Relief Act, 1963 (for specific performance)")
-        analysis.append("• Registration Act, 1908 (for property registration)")
-        analysis.append("• State-specific Land Revenue Acts")
-        
-        analysis.append("\nIMMEDIATE ACTIONS REQUIRED:")
-        analysis.append("1. Collect all property documents (sale deed, title deed, mutation records)")
-        analysis.append("2. Get property survey done to verify boundaries")
-        analysis.append("3. Check encumbrance certificate from sub-registrar office")
-        analysis.append("4. Verify ownership chain - trace back 30 years minimum")
-        analysis.append("5. Check for any pending litigation on the property")
-        analysis.append("6. Document any illegal occupation or encroachment with photos/videos")
-        
-        analysis.append("\nDOCUMENTS TO COLLECT:")
-        analysis.append("• Sale/Purchase deed")
-        analysis.append("• Title deed and ownership chain")
-        analysis.append("• Mutation records (7/12 extract, khasra, etc.)")
-        analysis.append("• Property tax receipts")
-        analysis.append("• Encumbrance certificate")
-        analysis.append("• Survey/plot plan")
-        analysis.append("• Building plan approval (if applicable)")
-        analysis.append("• Will/succession certificate (if inheritance case)")
-        
-        analysis.append("\nRESOLUTION OPTIONS:")
-        analysis.append("1. Negotiation and settlement (fastest and cheapest)")
-        analysis.append("2. Mediation through court or private mediator")
-        analysis.append("3. Civil suit in appropriate court")
-        analysis.append("4. Partition suit (if co-owned property)")
-        analysis.append("5. Injunction to prevent alienation/damage")
-        
-        analysis.append("\nNEXT STEPS:")
-        analysis.append("1. Consult a property lawyer with all documents")
-        analysis.append("2. Get legal opinion on ownership status")
-        analysis.append("3. Attempt amicable settlement first")
-        analysis.append("4. If settlement fails, file appropriate civil suit")
-        analysis.append("5. Apply for interim injunction if urgent")
-        
-        return f"""═══════════════════════════════════════════════════
-LEGAL CONSULTATION REPORT - PROPERTY DISPUTE
-═══════════════════════════════════════════════════
-
-Case Type: PROPERTY DISPUTE
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-─────────────────────────────────────────────────
-CLIENT STATEMENT:
-{situation}
-
-─────────────────────────────────────────────────
-FACTS COLLECTED:
-{facts if facts else 'Limited information - answer all questions for detailed analysis'}
-
-─────────────────────────────────────────────────
-LEGAL ANALYSIS:
-
-{chr(10).join(analysis)}
-
-─────────────────────────────────────────────────
-CRITICAL REMINDERS:
-⚠ Property disputes can take years - document everything
-⚠ Verify all documents before making any payment
-⚠ Get title search done by professional lawyer
-⚠ Do not make any physical changes to disputed property
-
-─────────────────────────────────────────────────
-DISCLAIMER:
-This is a preliminary legal analysis based on the information provided.
-Property laws vary by state. Please consult a qualified property lawyer
-for case-specific advice and representation.
-═══════════════════════════════════════════════════"""
+        return [
+            _CASE_REPORT_HEADER.format(title='PROPERTY DISPUTE', case_label='PROPERTY DISPUTE'),
+            _CLIENT_STATEMENT_SECTION.format(situation=situation),
+            _FACTS_COLLECTED_SECTION.format(facts=facts if facts else _NO_FACTS_COLLECTED),
+            _LEGAL_ANALYSIS_HEADING + '\n'.join(analysis) + '\n',
+            _PROPERTY_STATIC,
+            _PROPERTY_REMINDERS,
+            _PROPERTY_DISCLAIMER,
+        ]
     
-    def _analyze_family_case(self, situation, dates, facts):
+    def _analyze_family_case(self, situation, dates, locations, values, items, facts):
         """Detailed family law analysis"""
         return self._generate_template_report('family', 'family', situation, facts)
     
-    def _analyze_contract_case(self, situation, dates, values, facts):
+    def _analyze_contract_case(self, situation, dates, locations, values, items, facts):
         """Detailed contract dispute analysis"""
         return self._generate_template_report('contract', 'contract', situation, facts)
     
     def _generate_template_report(self, case_type, subtype, situation, facts):
         # Fallback template when LLM unavailable
         if case_type == 'criminal':
-            steps = """1. File FIR immediately at the nearest police station
-2. Collect and preserve all evidence (photos, documents, CCTV)
-3. Get witness statements recorded
-4. Obtain medical examination report if injuries present
-5. Consult a criminal lawyer for detailed legal strategy"""
+            steps = _CRIMINAL_STEPS
         elif case_type == 'family':
-            steps = """1. Attempt mediation/counseling first if applicable
-2. Gather all relevant documents (marriage certificate, financial records)
-3. Document any incidents with dates and evidence
-4. Consult a family law specialist
-5. Consider filing petition in family court if mediation fails"""
+            steps = _FAMILY_STEPS
         else:
-            steps = """1. Gather all relevant documents and evidence
-2. Document timeline of events
-3. Identify witnesses if any
-4. Consult appropriate legal specialist
-5. File case in appropriate court if required"""
+            steps = _GENERAL_STEPS
         
-        return f"""═══════════════════════════════════════════════════
-LEGAL CONSULTATION REPORT
-═══════════════════════════════════════════════════
-
-Case Type: {case_type.upper()}
-Subtype: {subtype}
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-─────────────────────────────────────────────────
-CLIENT STATEMENT:
-{situation}
-
-─────────────────────────────────────────────────
-FACTS EXTRACTED:
-{facts if facts else 'Limited information available'}
-
-─────────────────────────────────────────────────
-LEGAL ANALYSIS:
-
-Based on the information provided, this appears to be a {case_type} 
-matter requiring immediate attention.
-
-RECOMMENDED LEGAL STEPS:
-{steps}
-
-IMPORTANT NOTES:
-• Act promptly - legal timelines are strict
-• Document everything thoroughly
-• Preserve all evidence
-• Consult a qualified lawyer immediately for case-specific advice
-
-─────────────────────────────────────────────────
-DISCLAIMER:
-This is a preliminary analysis based on limited information.
-Please consult a qualified legal professional for authoritative advice.
-═══════════════════════════════════════════════════"""
+        return [
+            _TEMPLATE_REPORT_HEADER.format(case_type_upper=case_type.upper(), subtype=subtype),
+            _CLIENT_STATEMENT_SECTION.format(situation=situation),
+            _FACTS_EXTRACTED_SECTION.format(facts=facts if facts else 'Limited information available'),
+            _TEMPLATE_ANALYSIS_SECTION.format(case_type=case_type, steps=steps),
+            _TEMPLATE_DISCLAIMER,
+        ]
 
 # -------------------------
 # Agentic Legal System with AI Models
 # -------------------------
+SESSION_MAX = int(os.getenv('SESS_MAX', '10000'))
+SESSION_TTL = int(os.getenv('SESS_TTL', '3600'))  # seconds since the session was last used
+SESSION_LOCK_STRIPES = 64  # power of two so a stripe is picked with a mask
+
+@dataclass(slots=True)
+class SessionState:
+    kg: KnowledgeGraph
+    case_type: str
+    max_turns: int = 7
+    turns_done: int = 0
+    finished: bool = False
+    query_history: List[str] = field(default_factory=list)
+    asked_questions: List[str] = field(default_factory=list)  # ✅ TRACK ASKED QUESTIONS (in order, for logging)
+    asked_questions_set: Set[str] = field(default_factory=set)  # membership checks
+    question_queues: Dict[str, deque] = field(default_factory=dict)  # template key -> pending (category, question) deque
+    last_body: Optional[List[str]] = None  # latest report sections, re-stamped whenever resent
+
 class AgenticLegalSystem:
     def __init__(self):
         self.classifier = SmartClassifierAgent()
         self.extractor = EntityExtractionAgent()
         self.qgen = AdaptiveQuestionGenerator()
         self.analyzer = AIAnalyzer()
-        self.sessions = {}
+        # Bounded LRU + TTL so abandoned consultations expire instead of piling up.
+        # TTLCache isn't thread-safe: self.lock guards only inserts/lookups/evictions,
+        # per-session state is guarded by a striped lock instead of one Lock per session
+        self.sessions = TTLCache(maxsize=SESSION_MAX, ttl=SESSION_TTL)
         self.lock = Lock()
+        self._stripes = tuple(Lock() for _ in range(SESSION_LOCK_STRIPES))
+        self.session_hits = 0
+        self.session_misses = 0
+
+    async def warm_up(self):
+        """Run one consultation turn's pipeline without a session, so the first user skips first-call costs"""
+        query = "My phone was stolen in New Delhi on 12/03/2024, worth Rs 15,000"
+        case_type, _ = self.classifier.initial_classify(query)
+        kg = KnowledgeGraph()
+        kg.set_context('situation', query)
+        kg.set_context('case_type', case_type)
+        kg.add_entities_bulk(self.extractor.extract(query))
+        kg.set_context('criminal_subtype', self.qgen.detect_crime_subtype(kg.situation_plus_entities()))
+        self.qgen.generate_next(case_type, kg, frozenset())
+        await run_in_threadpool(self.analyzer.analyze, case_type, kg)
+
+    def _session_lock(self, session_id: str) -> Lock:
+        return self._stripes[hash(session_id) & (SESSION_LOCK_STRIPES - 1)]
 
-    def start_session(self, query: str, max_turns: int = 7) -> Dict:
+    def _get_session(self, session_id: str) -> Optional[SessionState]:
+        with self.lock:
+            state = self.sessions.get(session_id)
+            if state is None:
+                self.session_misses += 1
+            else:
+                self.session_hits += 1
+                self.sessions[session_id] = state  # touch: restart the TTL and mark most recently used
+        return state
+
+    async def start_session(self, query: str, max_turns: int = 7) -> Dict:
         session_id = str(uuid.uuid4())
         case_type, conf = self.classifier.initial_classify(query)
         
-        logger.info(f"New session {session_id}: {case_type} (confidence: {conf:.2f})")
+        logger.info("New session %s: %s (confidence: %.2f)", session_id, case_type, conf)
         
         kg = KnowledgeGraph()
         kg.set_context('situation', query)
@@ -667,32 +1178,32 @@ class AgenticLegalSystem:
         kg.set_context('criminal_subtype', self.qgen.detect_crime_subtype(query))
 
         # Extract initial entities
-        extracted = self.extractor.extract(query)
-        for k, vals in extracted.items():
-            for v in vals:
-                kg.add_entity(k, v)
+        kg.add_entities_bulk(self.extractor.extract(query))
+
+        # Generate first question
+        question_queues = {}
+        q = self.qgen.generate_next(case_type, kg, frozenset(), question_queues)
+        will_ask = bool(q) and max_turns > 0
 
         # Store session with asked questions list
+        state = SessionState(
+            kg=kg,
+            case_type=case_type,
+            max_turns=max_turns,
+            finished=not will_ask,
+            query_history=[query],
+            asked_questions=[q] if will_ask else [],
+            asked_questions_set={q} if will_ask else set(),
+            question_queues=question_queues
+        )
         with self.lock:
-            self.sessions[session_id] = {
-                'query_history': [query],
-                'kg': kg,
-                'case_type': case_type,
-                'turns_done': 0,
-                'max_turns': max_turns,
-                'asked_questions': [],  # ✅ TRACK ASKED QUESTIONS
-                'finished': False
-            }
+            self.sessions[session_id] = state
 
-        # Generate first question
-        q = self.qgen.generate_next(case_type, kg, [])
-        if q and max_turns > 0:
-            with self.lock:
-                self.sessions[session_id]['asked_questions'].append(q)  # ✅ MARK AS ASKED
-            
-            # Generate partial report with AI
-            report = self.analyzer.analyze(case_type, kg)
-            logger.info(f"First question: {q}")
+        # Generate partial report with AI (off the event loop)
+        state.last_body = await run_in_threadpool(self.analyzer.analyze_body, case_type, kg)
+        report = self.analyzer.render(state.last_body)
+        if will_ask:
+            logger.info("First question: %s", q)
             return {
                 'session_id': session_id,
                 'next_action': 'ask',
@@ -700,9 +1211,6 @@ class AgenticLegalSystem:
                 'partial_report': report
             }
 
-        with self.lock:
-            self.sessions[session_id]['finished'] = True
-        report = self.analyzer.analyze(case_type, kg)
         return {
             'session_id': session_id,
             'next_action': 'final',
@@ -710,44 +1218,60 @@ class AgenticLegalSystem:
             'partial_report': report
         }
 
-    def answer_session(self, session_id: str, answer: str) -> Dict:
-        with self.lock:
-            state = self.sessions.get(session_id)
-        
-        if not state:
+    async def answer_session(self, session_id: str, answer: str) -> Dict:
+        state = self._get_session(session_id)
+        if state is None:
             raise KeyError("session not found")
 
-        logger.info(f"Session {session_id} turn {state['turns_done']}: {answer[:50]}...")
+        answer = answer.strip()
+        if not answer:
+            # Nothing to record: resend the pending question (or final report) without using a turn
+            if state.finished:
+                return {'next_action': 'final', 'report': self.analyzer.render(state.last_body), 'structured': {}}
+            return {
+                'next_action': 'ask',
+                'question': state.asked_questions[-1],
+                'partial_report': self.analyzer.render(state.last_body)
+            }
 
-        # Add answer to history
-        state['query_history'].append(answer)
-        state['turns_done'] += 1
+        logger.info("Session %s turn %d: %.50s...", session_id, state.turns_done, answer)
 
-        # Extract entities from answer
-        extracted = self.extractor.extract(answer)
-        for k, vals in extracted.items():
-            for v in vals:
-                state['kg'].add_entity(k, v)
+        # Same text as the previous turn adds no new entities, so the KG and report can't change
+        repeated = answer == state.query_history[-1]
 
-        # Update subtype based on accumulated facts
-        state['kg'].set_context('criminal_subtype', self.qgen.detect_crime_subtype(
-            state['kg'].context.get('situation', '') + " " +
-            " ".join([x for vals in state['kg'].entities.values() for x in vals])
-        ))
+        # Add answer to history
+        state.query_history.append(answer)
+        state.turns_done += 1
 
-        # Generate AI analysis with updated facts
-        report = self.analyzer.analyze(state['case_type'], state['kg'])
+        if repeated:
+            report = self.analyzer.render(state.last_body)
+        else:
+            extracted = self.extractor.extract(answer)
+            # Report readers snapshot the KG under this lock, so merge under it too
+            with self._session_lock(session_id):
+                state.kg.add_entities_bulk(extracted)
+                # Update subtype based on accumulated facts
+                state.kg.set_context('criminal_subtype',
+                                     self.qgen.detect_crime_subtype(state.kg.situation_plus_entities()))
+                kg = state.kg.snapshot()
+
+            # Generate AI analysis with updated facts (on a copy: it runs on a worker thread)
+            state.last_body = await run_in_threadpool(self.analyzer.analyze_body, state.case_type, kg)
+            report = self.analyzer.render(state.last_body)
 
         # Check if we should ask more questions
-        if state['turns_done'] < state['max_turns']:
-            # ✅ PASS THE LIST OF ASKED QUESTIONS
-            logger.info(f"Asked questions so far: {state['asked_questions']}")
-            q = self.qgen.generate_next(state['case_type'], state['kg'], state['asked_questions'])
+        if state.turns_done < state.max_turns:
+            # ✅ PASS THE SET OF ASKED QUESTIONS (the list is kept for ordering/logging)
+            logger.info("Asked questions so far: %s", state.asked_questions)
+            # Under the session lock: the pending-question deques are mutated in place
+            with self._session_lock(session_id):
+                q = self.qgen.generate_next(state.case_type, state.kg, state.asked_questions_set,
+                                            state.question_queues)
+                if q:
+                    state.asked_questions.append(q)  # ✅ MARK AS ASKED
+                    state.asked_questions_set.add(q)
             if q:
-                with self.lock:
-                    state['asked_questions'].append(q)  # ✅ MARK AS ASKED
-                    self.sessions[session_id] = state
-                logger.info(f"Next question: {q}")
+                logger.info("Next question: %s", q)
                 return {
                     'next_action': 'ask',
                     'question': q,
@@ -755,10 +1279,8 @@ class AgenticLegalSystem:
                 }
 
         # No more questions - finalize
-        logger.info(f"Session {session_id} complete")
-        with self.lock:
-            state['finished'] = True
-            self.sessions[session_id] = state
+        logger.info("Session %s complete", session_id)
+        state.finished = True  # single store, atomic on its own
 
         return {
             'next_action': 'final',
@@ -766,14 +1288,45 @@ class AgenticLegalSystem:
             'structured': {}
         }
 
+    async def report_sections(self, session_id: str) -> List[str]:
+        state = self._get_session(session_id)
+        if state is None:
+            raise KeyError("session not found")
+        # Snapshot on the event loop; the worker thread must not iterate the live entity dicts
+        with self._session_lock(session_id):
+            kg = state.kg.snapshot()
+        return await run_in_threadpool(self.analyzer.analyze_sections, state.case_type, kg)
+
 # Create system instance
 system = AgenticLegalSystem()
-logger.info(f"Agentic Legal System ready | LLM: {llm_name or 'Not loaded'} | Embeddings: {'Loaded' if embedder else 'Not loaded'}")
+logger.info("Agentic Legal System ready | models loading in background")
 
 # -------------------------
 # FastAPI App
 # -------------------------
-app = FastAPI(title="ChatLaw Legal Consultation API with AI Models")
+THREADPOOL_SIZE = int(os.getenv('THREADPOOL_SIZE', '40'))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start serving immediately; the classifier/question endpoints don't need the models
+    # Blocking consult work runs on AnyIO's worker threads; size them to what the host can run at once
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    loop = asyncio.get_running_loop()
+    app.state.models_ready = asyncio.Event()
+    app.state.model_loader = loop.run_in_executor(None, load_models, loop, app.state.models_ready)
+    try:
+        await system.warm_up()
+    except Exception as e:
+        logger.warning("Warm-up failed: %s", e)
+    yield
+
+# orjson encodes the large report strings natively instead of through the stdlib json encoder
+app = FastAPI(
+    title="ChatLaw Legal Consultation API with AI Models",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse if HAS_ORJSON else JSONResponse
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -785,19 +1338,34 @@ app.add_middleware(
 
 @app.get("/")
 def root():
+    models_ready = getattr(app.state, 'models_ready', None)
     return {
         "status": "ChatLaw API is running with AI models",
+        # models_ready is created by lifespan; absent when it didn't run (e.g. --lifespan off)
+        "models_ready": models_ready is not None and models_ready.is_set(),
         "llm_loaded": llm_model is not None,
         "llm_name": llm_name,
         "embeddings_loaded": embedder is not None
     }
 
+@app.get("/metrics")
+def metrics():
+    with system.lock:
+        active = len(system.sessions)
+    return {
+        "sessions_active": active,
+        "sessions_max": SESSION_MAX,
+        "session_ttl_seconds": SESSION_TTL,
+        "session_hits": system.session_hits,
+        "session_misses": system.session_misses
+    }
+
 @app.post("/consult/start", response_model=ConsultationStartResponse)
-def consult_start(req: ConsultationStartRequest):
+async def consult_start(req: ConsultationStartRequest):
     if not req.query or not req.query.strip():
         raise HTTPException(status_code=400, detail="Query is required")
     
-    out = system.start_session(req.query.strip(), max_turns=req.max_turns or 7)
+    out = await system.start_session(req.query.strip(), max_turns=req.max_turns or 7)
     return ConsultationStartResponse(
         session_id=out['session_id'],
         next_action=out['next_action'],
@@ -806,9 +1374,9 @@ def consult_start(req: ConsultationStartRequest):
     )
 
 @app.post("/consult/answer")
-def consult_answer(req: ConsultationAnswerRequest):
+async def consult_answer(req: ConsultationAnswerRequest):
     try:
-        out = system.answer_session(req.session_id, req.answer)
+        out = await system.answer_session(req.session_id, req.answer)
     except KeyError:
         raise HTTPException(status_code=404, detail="session not found")
     
@@ -826,6 +1394,48 @@ def consult_answer(req: ConsultationAnswerRequest):
             timestamp=datetime.now().isoformat()
         )
 
+def sse_event(data: Dict, event: Optional[str] = None) -> str:
+    """Frame one Server-Sent Event: optional event name, then a single JSON data line"""
+    payload = orjson.dumps(data).decode() if HAS_ORJSON else json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n" if event else f"data: {payload}\n\n"
+
+@app.get("/consult/{session_id}/report/stream")
+async def consult_report_stream(session_id: str):
+    try:
+        sections = await system.report_sections(session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="session not found")
+
+    return StreamingResponse(iter(sections), media_type="text/plain; charset=utf-8")
+
+@app.get("/consult/{session_id}/report/events")
+async def consult_report_events(session_id: str):
+    try:
+        sections = await system.report_sections(session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="session not found")
+
+    async def events():
+        for section in sections:
+            yield sse_event({"section": section})
+        yield sse_event({"done": True}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Sessions and caches live in process memory: more than one worker needs sticky routing by session_id
+    workers = int(os.getenv('WORKERS', '1'))
+    uvicorn.run(
+        "app:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop" if importlib.util.find_spec('uvloop') else "asyncio",
+        http="httptools" if importlib.util.find_spec('httptools') else "h11",
+        workers=workers,
+        lifespan="on"
+    )
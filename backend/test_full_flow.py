@@ -72,5 +72,23 @@ def test_full_consultation():
     print("Test completed!")
     print("=" * 60)
 
+def test_devanagari_entities():
+    print("\n" + "=" * 60)
+    print("Testing entity extraction on Devanagari digits")
+    print("=" * 60)
+
+    response = requests.post(
+        f"{BASE_URL}/consult/start",
+        json={"query": "my phone was stolen on १२/०३/२०२४, worth Rs १५००", "max_turns": 3}
+    )
+    report = response.json().get('partial_report') or ''
+
+    for expected in ["१२/०३/२०२४", "Rs १५००"]:
+        if expected in report:
+            print(f"   ✅ Extracted {expected}")
+        else:
+            print(f"   ❌ {expected} missing from the report")
+
 if __name__ == "__main__":
     test_full_consultation()
+    test_devanagari_entities()